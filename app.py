@@ -1,14 +1,27 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import asyncio
+import copy
+import html
 import json
+import logging
+import os
 import random
+import re
+import threading
 import time
+import httpx
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
-from groq import Groq
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_core.prompts import PromptTemplate
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Generator, Iterator
 from pydantic import BaseModel, Field
 
+if TYPE_CHECKING:
+    from groq import AsyncGroq, Groq
+
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # PYDANTIC MODELS
 # ============================================================================
@@ -56,6 +69,203 @@ class DiagnosticEvaluation(BaseModel):
     areas_for_improvement: List[str] = Field(..., description="What to improve")
     key_findings_missed: List[str] = Field(default=[], description="Important information not gathered")
 
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+CASE_CONDITIONS = ("hypertension", "diabetes", "chest pain", "headache",
+                   "fever", "abdominal pain", "shortness of breath")
+
+QUESTION_SIMILARITY_THRESHOLD = 0.93
+
+DEFAULT_REPLY_TIMEOUT = 8.0
+DEFAULT_MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT_LLM", "4"))
+
+INFO_STOPWORDS = frozenset((
+    "a", "an", "the", "and", "or", "of", "for", "in", "on", "at", "to", "with", "from", "by",
+    "is", "are", "was", "were", "has", "have", "had", "be", "been", "patient", "patients",
+    "his", "her", "their", "my", "i", "he", "she", "they",
+))  # negations like "no" and "denies" are kept, so "no fever" and "fever" stay distinct
+
+HINTS = (
+    "Consider asking about the onset and progression of symptoms.",
+    "Have you checked the patient's vital signs?",
+    "Think about risk factors relevant to this age group.",
+    "Consider asking about associated symptoms.",
+    "What about the patient's past medical history?",
+    "Are there any red flags that require immediate attention?",
+    "Consider the patient's medications - any relevant interactions?",
+    "Think about the differential diagnoses for this presentation.",
+)
+
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=16, max_connections=32, keepalive_expiry=60)
+
+# Completions get one SDK retry on top of their short timeouts; other calls keep the SDK default of two.
+# SDK retries cover timeouts, dropped connections, 408/409/429 and 5xx, honouring Retry-After.
+COMPLETION_RETRIES = 1
+
+@st.cache_resource
+def get_groq_client(api_key: str) -> "Groq":
+    """Groq client with a pooled HTTP/2 connection, shared across Streamlit reruns"""
+    # The SDK is only imported once an API key has been entered
+    from groq import Groq
+
+    return Groq(
+        api_key=api_key,
+        http_client=httpx.Client(http2=True, limits=HTTP_LIMITS),
+    )
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived event loop on a daemon thread for all async Groq calls
+
+    Async connections belong to the loop that opened them, so the shared
+    async client must always be driven from this one loop.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_async_groq_client(api_key: str) -> "AsyncGroq":
+    """Async Groq client with a pooled HTTP/2 connection, used only on get_event_loop()"""
+    from groq import AsyncGroq
+
+    return AsyncGroq(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS),
+    )
+
+@st.cache_resource
+def get_llm_semaphore(max_concurrent: int) -> threading.BoundedSemaphore:
+    """Cap on in-flight sync Groq completions
+
+    Bounding concurrency keeps double clicks and batches from tripping rate
+    limits (429s) that would stall every other request.
+    """
+    return threading.BoundedSemaphore(max_concurrent)
+
+@st.cache_resource
+def get_async_semaphores() -> Dict[int, asyncio.Semaphore]:
+    """Caps on in-flight async Groq completions by limit
+
+    asyncio primitives belong to the loop that uses them, so entries are only
+    created by async_llm_semaphore from coroutines running on get_event_loop().
+    """
+    return {}
+
+def async_llm_semaphore(semaphores: Dict[int, asyncio.Semaphore], max_concurrent: int) -> asyncio.Semaphore:
+    """Cap on in-flight async completions, created on get_event_loop() on first use"""
+    if max_concurrent not in semaphores:
+        semaphores[max_concurrent] = asyncio.Semaphore(max_concurrent)
+    return semaphores[max_concurrent]
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Background worker pool shared across Streamlit reruns"""
+    return ThreadPoolExecutor(max_workers=2)
+
+@st.cache_resource
+def get_embedding_model():
+    """Sentence embedding model used to spot repeated questions, or None if unavailable
+
+    Load failures are cached as None too, so an offline Hugging Face hub only
+    disables repeated-question matching instead of failing every question.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    try:
+        return SentenceTransformer("all-MiniLM-L6-v2")
+    except Exception:
+        logger.warning("Could not load the sentence embedding model; repeated questions will not be matched",
+                       exc_info=True)
+        return None
+
+def llm_errors() -> tuple:
+    """Exceptions a failed or malformed LLM call raises, for handlers that wrap Streamlit output
+
+    Streamlit's rerun and stop signals also derive from Exception, so
+    handlers around widget or streaming code must not catch Exception itself.
+    """
+    from groq import APIError
+
+    return APIError, ValueError  # pydantic's ValidationError is a ValueError
+
+@lru_cache(maxsize=None)
+def normalize_info(info: str) -> str:
+    """Order-insensitive key for a revealed fact, so rephrasings of it collide"""
+    tokens = set()
+    for token in re.findall(r"[a-z0-9]+", info.lower()):
+        if token in INFO_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.add(token)
+    return " ".join(sorted(tokens))
+
+def build_compact_persona(patient_profile: Dict, profile_text: Dict[str, str]) -> str:
+    """Short roleplay system prompt: demographics, what the patient knows, and answering rules"""
+    personality = patient_profile.get('patient_personality', 'cooperative')
+    age = patient_profile.get('age', 50)
+    education_level = "high school" if age > 60 else "college"
+
+    return (
+        f"You are a {age}-year-old {patient_profile['gender'].lower()} patient ({personality}, "
+        f"{education_level} education) talking to a medical student.\n\n"
+        f"WHAT YOU KNOW:\n"
+        f"- Chief complaint: {patient_profile['chief_complaint']}\n"
+        f"- Symptoms: {patient_profile['history_of_present_illness']}\n"
+        f"- Past medical history: {profile_text['pmh'] or 'none'}\n"
+        f"- Medications: {profile_text['meds'] or 'none'}\n"
+        f"- Social history: {patient_profile['social_history']}\n"
+        f"- Exam findings: {patient_profile['physical_exam_findings']}\n\n"
+        "RULES:\n"
+        "1. Answer in at most 2 sentences, in the first person.\n"
+        "2. Answer only what was asked; do not volunteer other facts.\n"
+        "3. Use everyday words, never medical jargon or numbers a patient would not know.\n"
+        "4. Show fitting emotion: worry, pain, confusion or relief.\n"
+        "5. Stay consistent with the facts above and with your earlier answers."
+    )
+
+def profile_strings(patient_profile: Dict) -> Dict[str, str]:
+    """Pre-join the list fields of a patient profile that prompts interpolate, dropping repeats"""
+    return {
+        "pmh": ", ".join(dict.fromkeys(patient_profile["past_medical_history"])),
+        "meds": ", ".join(dict.fromkeys(patient_profile["medications"])),
+        "ddx": ", ".join(dict.fromkeys(patient_profile["differential_diagnoses"])),
+    }
+
+_PARTIAL_UNICODE_ESCAPE = re.compile(r"(?<!\\)((?:\\\\)*)\\u[0-9a-fA-F]{0,3}$")
+_TRAILING_HIGH_SURROGATE = re.compile(r"(?<!\\)((?:\\\\)*)\\u[dD][89abAB][0-9a-fA-F]{2}$")
+
+def partial_json_string(partial_json: str, key: str) -> str:
+    """Decode the string value of a key from a JSON document that is still being generated"""
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*"', partial_json)
+    if match is None:
+        return ""
+
+    chars = []
+    escaped = False
+    for char in partial_json[match.end():]:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            break
+        chars.append(char)
+
+    raw = "".join(chars)
+    if escaped:
+        raw = raw[:-1]
+    # Drop a \uXXXX escape whose hex digits have not arrived yet
+    raw = _PARTIAL_UNICODE_ESCAPE.sub(r"\1", raw)
+    # Hold back the high half of a surrogate pair until the low half arrives
+    raw = _TRAILING_HIGH_SURROGATE.sub(r"\1", raw)
+    return json.loads(f'"{raw}"')
+
 # ============================================================================
 # CORE CLASSES
 # ============================================================================
@@ -63,36 +273,149 @@ class DiagnosticEvaluation(BaseModel):
 class Llama3Processor:
     """Base class for all LLM interactions"""
     client = None
+    async_client = None
 
     def __init__(self):
         self.user_input = None
         self.pydantic_object = None
         self.system_prompt = None
+        self.use_tool_call = False
+        self.model_name = "llama-3.3-70b-versatile"
+        self.request_timeout = DEFAULT_REPLY_TIMEOUT
+        self.limit_concurrency(DEFAULT_MAX_CONCURRENT)
+
+    def limit_concurrency(self, max_concurrent: int):
+        """Set the cap on in-flight completions and resolve its shared semaphore
+
+        Call from the Streamlit script thread: background workers have no
+        ScriptRunContext, so they must not look up st.cache_resource themselves.
+        """
+        self.max_concurrent = max_concurrent
+        self.semaphore = get_llm_semaphore(max_concurrent)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _prompt_prefix(pydantic_object: type) -> str:
+        """Prompt preamble with the schema's compact JSON schema, rendered once per schema"""
+        schema = json.dumps(pydantic_object.model_json_schema(), separators=(",", ":"))
+        return f"Answer the user query as a JSON object matching this schema:\n{schema}\n"
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _tool(pydantic_object: type) -> Dict:
+        """Function-calling tool definition for a response schema"""
+        return {
+            "type": "function",
+            "function": {
+                "name": pydantic_object.__name__,
+                "description": pydantic_object.__doc__,
+                "parameters": pydantic_object.model_json_schema(),
+            },
+        }
 
-    def prompt_llama3(self, text: str) -> str:
-        """Send prompt to Llama and get structured JSON response"""
+    def _context_messages(self) -> List[Dict]:
+        """Earlier messages to send between the system prompt and the query"""
+        return []
+
+    def _build_messages(self, text: str, use_tool_call: bool) -> List[Dict]:
+        """Build the chat messages for a single query"""
         user_input = f"{self.user_input}:\n{text}"
-        
-        pydantic_parser = PydanticOutputParser(pydantic_object=self.pydantic_object)
-        
-        prompt = PromptTemplate(
-            template="Answer the user query.\n{format_instructions}\n{query}\n",
-            input_variables=["query"],
-            partial_variables={"format_instructions": pydantic_parser.get_format_instructions()},
-        )
-        
-        _input = prompt.format(query=user_input)
-        
-        response = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": _input}
-            ],
-            temperature=0.7,
-        )
-        
-        return pydantic_parser.parse(response.choices[0].message.content).model_dump_json()
+        if use_tool_call:
+            _input = f"Answer the user query.\n{user_input}\n"
+        else:
+            _input = self._prompt_prefix(self.pydantic_object) + user_input + "\n"
+
+        return [
+            {"role": "system", "content": self.system_prompt},
+            *self._context_messages(),
+            {"role": "user", "content": _input}
+        ]
+
+    def _completion_kwargs(self, text: str, use_tool_call: bool) -> Dict:
+        """Keyword arguments for chat.completions.create constraining output to the schema"""
+        kwargs = {
+            "model": self.model_name,
+            "messages": self._build_messages(text, use_tool_call),
+            "temperature": 0.7,
+        }
+        if use_tool_call:
+            kwargs["tools"] = [self._tool(self.pydantic_object)]
+            kwargs["tool_choice"] = {"type": "function", "function": {"name": self.pydantic_object.__name__}}
+        else:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    def _parse_response(self, response) -> BaseModel:
+        """Validate a completion against the schema"""
+        message = response.choices[0].message
+        if self.use_tool_call:
+            content = message.tool_calls[0].function.arguments
+        else:
+            content = message.content
+        return self._validate(content)
+
+    def _validate(self, content: str) -> BaseModel:
+        """Validate raw JSON output against the schema"""
+        return self.pydantic_object.model_validate_json(content)
+
+    def _timeout(self) -> httpx.Timeout:
+        """Per-request timeout, kept just above typical latency so slow tail requests are retried"""
+        return httpx.Timeout(self.request_timeout, connect=2.0)
+
+    def _create_completion(self, **kwargs):
+        """Call chat.completions.create with this processor's timeout, retrying once"""
+        client = self.client.with_options(timeout=self._timeout(), max_retries=COMPLETION_RETRIES)
+        with self.semaphore:
+            return client.chat.completions.create(**kwargs)
+
+    def prompt_llama3(self, text: str) -> BaseModel:
+        """Send prompt to Llama and get the validated structured response"""
+        response = self._create_completion(**self._completion_kwargs(text, self.use_tool_call))
+        return self._parse_response(response)
+
+    def prompt_llama3_stream(self, text: str) -> Iterator[str]:
+        """Send prompt to Llama and yield the raw JSON output as it is generated"""
+        # Tool-call arguments are not streamed incrementally, so streaming always uses JSON mode
+        client = self.client.with_options(timeout=self._timeout(), max_retries=COMPLETION_RETRIES)
+        kwargs = self._completion_kwargs(text, False)
+        # The request stays open until the last chunk, so hold the slot for the whole stream
+        with self.semaphore:
+            stream = client.chat.completions.create(**kwargs, stream=True)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+    def stream_field(self, text: str, key: str) -> Generator[str, None, BaseModel]:
+        """Yield new text of one string field as it is generated and return the validated response"""
+        buffer = ""
+        emitted = ""
+        for delta in self.prompt_llama3_stream(text):
+            buffer += delta
+            value = partial_json_string(buffer, key)
+            if len(value) > len(emitted):
+                yield value[len(emitted):]
+                emitted = value
+
+        return self._validate(buffer)
+
+    def prompt_llama3_batch(self, texts: List[str]) -> List[BaseModel]:
+        """Send several independent prompts concurrently and get validated responses in order"""
+
+        semaphores = get_async_semaphores()
+
+        async def _complete(client: "AsyncGroq", semaphore: asyncio.Semaphore, text: str) -> BaseModel:
+            kwargs = self._completion_kwargs(text, self.use_tool_call)
+            async with semaphore:
+                response = await client.chat.completions.create(**kwargs)
+            return self._parse_response(response)
+
+        async def _gather() -> List[BaseModel]:
+            client = self.async_client.with_options(timeout=self._timeout(), max_retries=COMPLETION_RETRIES)
+            semaphore = async_llm_semaphore(semaphores, self.max_concurrent)
+            return await asyncio.gather(*(_complete(client, semaphore, text) for text in texts))
+
+        return asyncio.run_coroutine_threadsafe(_gather(), get_event_loop()).result()
 
 class VirtualPatientGenerator(Llama3Processor):
     """Generates realistic patient cases using LLM"""
@@ -129,98 +452,202 @@ class VirtualPatientGenerator(Llama3Processor):
         )
 
         self.pydantic_object = PatientProfile
+        self.request_timeout = 60.0
 
-    def generate_patient(self, disease_or_symptoms: str) -> Dict:
-        """Generate a complete patient case"""
-        prompt = (
+    def _case_prompt(self, disease_or_symptoms: str) -> str:
+        """Build the case generation prompt for a condition"""
+        return (
             f"Create a realistic, detailed patient case for: {disease_or_symptoms}\n\n"
             f"Ensure the case is medically accurate, educationally valuable, and has appropriate "
             f"complexity for medical students. Include subtle findings that students should discover "
             f"through good questioning. Make the patient's presentation realistic - not textbook perfect."
         )
-        
-        result = self.prompt_llama3(prompt)
-        return json.loads(result)
+
+    def generate_patient(self, disease_or_symptoms: str) -> Dict:
+        """Generate a complete patient case"""
+        return self.prompt_llama3(self._case_prompt(disease_or_symptoms)).model_dump()
+
+    def generate_patients(self, list_of_conditions: List[str]) -> List[Dict]:
+        """Generate several patient cases concurrently, one per condition"""
+        results = self.prompt_llama3_batch([self._case_prompt(c) for c in list_of_conditions])
+        return [result.model_dump() for result in results]
+
+    def generate_patients_batch(self, conditions: List[str], poll_interval: float = 30.0) -> List[Dict]:
+        """Generate patient cases in bulk through the Groq Batch API
+
+        Batch jobs run on spare capacity at reduced cost but may take minutes
+        to hours, so this is meant for preparing cases ahead of a class; use
+        generate_patient for interactive sessions.
+        """
+        from groq import APIConnectionError, InternalServerError, RateLimitError
+
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._completion_kwargs(self._case_prompt(condition), self.use_tool_call),
+            })
+            for i, condition in enumerate(conditions)
+        ]
+        batch_file = self.client.files.create(
+            file=("patient_cases.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            try:
+                batch = self.client.batches.retrieve(batch.id)
+            except (APIConnectionError, InternalServerError, RateLimitError):
+                continue  # the job keeps running server-side, so a failed poll only delays the next check
+        if batch.status != "completed":
+            raise RuntimeError(f"Patient case batch {batch.id} ended with status '{batch.status}'")
+
+        # Successful items are written to the output file and failed ones to the error file
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results += [json.loads(line) for line in self.client.files.content(file_id).text().splitlines()
+                            if line.strip()]
+
+        patients = [None] * len(conditions)
+        errors = {}
+        for result in results:
+            index = int(result["custom_id"])
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                errors[index] = result.get("error") or response.get("body")
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            patients[index] = self._validate(content).model_dump()
+
+        for index, patient in enumerate(patients):
+            if patient is None:
+                errors.setdefault(index, "no result returned")
+        if errors:
+            failed = "; ".join(f"'{conditions[i]}': {errors[i]}" for i in sorted(errors))
+            raise RuntimeError(f"Patient case batch {batch.id} failed for {len(errors)} of "
+                               f"{len(conditions)} conditions: {failed}")
+
+        return patients
 
 class PatientConversationHandler(Llama3Processor):
     """Handles realistic patient-student interactions"""
 
-    def __init__(self, patient_profile: Dict):
+    def __init__(self, patient_profile: Dict, profile_text: Dict[str, str] = None, persona: str = None):
         super().__init__()
         self.patient_profile = patient_profile
         self.conversation_history = []
-        self.revealed_information = set()
+        self.history_summary = ""
+        self.summary_threshold = 6
+        self.history_turns = 3
+        self.revealed_information: Dict[str, str] = {}
+        self.last_response = None
         self.question_count = 0
+        self._summary_future: Future = None
+        self.executor = get_executor()
 
-        personality = patient_profile.get('patient_personality', 'cooperative')
-        age = patient_profile.get('age', 50)
-        education_level = "high school" if age > 60 else "college"
-
-        self.system_prompt = (
-            f"You are roleplaying as a {age}-year-old {patient_profile['gender'].lower()} patient "
-            f"with {personality} personality seeking medical care. "
-            f"Your education level is {education_level}. "
-            f"Respond naturally and realistically as this specific patient would, using first-person language. "
-            f"\n\nIMPORTANT GUIDELINES:\n"
-            f"- Use simple, everyday language (avoid medical jargon unless your background suggests medical knowledge)\n"
-            f"- Describe symptoms in layman's terms (e.g., 'burning feeling' not 'dyspepsia')\n"
-            f"- Show appropriate emotions: worry, confusion, relief, pain, frustration\n"
-            f"- Be specific when you know details (exact times, durations, locations)\n"
-            f"- Be vague about things patients typically don't know (exact blood pressure numbers, medical terms)\n"
-            f"- Only reveal information directly answering the question asked\n"
-            f"- If you don't understand the question, ask for clarification\n"
-            f"- Show hesitation or uncertainty when appropriate\n"
-            f"- Mention concerns or questions you might have as a patient\n"
-            f"- Stay consistent with your patient profile throughout the conversation"
+        self.system_prompt = persona or build_compact_persona(
+            patient_profile, profile_text or profile_strings(patient_profile)
         )
 
         self.user_input = "Stay in character as the patient. Answer the medical student's question."
         self.pydantic_object = PatientResponse
+        self.use_tool_call = True
+        self.model_name = "llama-3.1-8b-instant"
+
+    def _context_messages(self) -> List[Dict]:
+        """Rolling summary plus the most recent turns as real chat messages"""
+        messages = []
+        if self.history_summary:
+            messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{self.history_summary}"})
+        for h in self.conversation_history[-self.history_turns:]:
+            messages.append({"role": "user", "content": h["student"]})
+            messages.append({"role": "assistant", "content": h["patient"]})
+        return messages
+
+    def _turn_context(self, student_question: str) -> str:
+        """Build the per-turn prompt for the student's question"""
+        return f"STUDENT'S CURRENT QUESTION: {student_question}"
+
+    def _record_turn(self, student_question: str, response_data: Dict):
+        """Store a completed turn in the conversation history"""
+        self.conversation_history.append({
+            "student": student_question,
+            "patient": response_data["response_text"],
+            "reveals_info": response_data.get("reveals_info", [])
+        })
+
+        for info in response_data.get("reveals_info", []):
+            self.revealed_information.setdefault(normalize_info(info), info)
+        self.last_response = response_data
+
+        if len(self.conversation_history) > self.summary_threshold:
+            # Summarize while the student reads and types instead of delaying this reply
+            self._summary_future = self.executor.submit(self._summarize_history)
+
+    def _wait_for_summary(self):
+        """Let a background summary finish before the history is read or extended"""
+        if self._summary_future is not None:
+            try:
+                self._summary_future.result()
+            except Exception:
+                # Keep the full history; summarizing is retried after the next turn
+                logger.warning("Could not summarize the interview history", exc_info=True)
+            self._summary_future = None
 
     def respond_to_question(self, student_question: str) -> Dict:
         """Generate realistic patient response to student's question"""
+        self._wait_for_summary()
         self.question_count += 1
 
-        recent_history = self.conversation_history[-3:] if len(self.conversation_history) > 0 else []
-        history_text = "\n".join([
-            f"Student asked: {h['student']}\nYou responded: {h['patient']}"
-            for h in recent_history
-        ])
-
-        context = f"""
-PATIENT PROFILE:
-- Age: {self.patient_profile['age']}, Gender: {self.patient_profile['gender']}
-- Chief Complaint: {self.patient_profile['chief_complaint']}
-- History: {self.patient_profile['history_of_present_illness']}
-- Past Medical History: {', '.join(self.patient_profile['past_medical_history'])}
-- Medications: {', '.join(self.patient_profile['medications'])}
-- Social History: {self.patient_profile['social_history']}
-- Physical Findings: {self.patient_profile['physical_exam_findings']}
-- Personality: {self.patient_profile.get('patient_personality', 'cooperative')}
-
-RECENT CONVERSATION:
-{history_text if history_text else "This is the first question."}
-
-STUDENT'S CURRENT QUESTION: {student_question}
-
-INSTRUCTIONS:
-Answer as the patient would. Be specific and helpful, but don't volunteer information
-beyond what's asked. Show appropriate emotion. Use everyday language. If it's a yes/no
-question, answer it but add a brief detail if it seems natural.
-"""
+        response = self.prompt_llama3(self._turn_context(student_question))
+        response_data = response.model_dump()
 
-        response = self.prompt_llama3(context)
-        response_data = json.loads(response)
+        self._record_turn(student_question, response_data)
 
-        self.conversation_history.append({
-            "student": student_question,
-            "patient": response_data["response_text"],
-            "reveals_info": response_data.get("reveals_info", [])
-        })
+        return response_data
 
-        self.revealed_information.update(response_data.get("reveals_info", []))
+    def respond_to_question_stream(self, student_question: str) -> Iterator[str]:
+        """Yield the patient's spoken response as it is generated
 
-        return response_data
+        The complete, validated response is available as last_response once
+        the generator is exhausted.
+        """
+        self._wait_for_summary()
+        self.question_count += 1
+
+        response = yield from self.stream_field(self._turn_context(student_question), "response_text")
+        self._record_turn(student_question, response.model_dump())
+
+    def _summarize_history(self):
+        """Fold all but the most recent turns into the rolling conversation summary"""
+        older_turns = "\n".join(
+            f"Student asked: {h['student']}\nPatient responded: {h['patient']}"
+            for h in self.conversation_history[:-self.history_turns]
+        )
+        previous_summary = f"Existing summary:\n{self.history_summary}\n\n" if self.history_summary else ""
+
+        response = self._create_completion(
+            model="llama-3.1-8b-instant",
+            messages=[
+                {"role": "system", "content": (
+                    "You summarize doctor-patient interviews. Write 3-4 short bullet sentences capturing "
+                    "what the student asked and every fact the patient revealed. Do not add new information."
+                )},
+                {"role": "user", "content": f"{previous_summary}New conversation turns:\n{older_turns}"}
+            ],
+            temperature=0.2,
+        )
+
+        self.history_summary = response.choices[0].message.content.strip()
+        self.conversation_history = self.conversation_history[-self.history_turns:]
 
 class DiagnosticEvaluator(Llama3Processor):
     """Evaluates student's diagnostic reasoning and provides feedback"""
@@ -237,14 +664,19 @@ class DiagnosticEvaluator(Llama3Processor):
 
         self.user_input = "Evaluate the student's diagnostic performance"
         self.pydantic_object = DiagnosticEvaluation
+        self.request_timeout = 30.0
+        self.last_evaluation = None
 
-    def evaluate(self, patient_profile: Dict, student_diagnosis: str,
-                 questions_asked: List[str], reasoning: str) -> Dict:
-        """Comprehensive evaluation of student performance"""
+    def _evaluation_context(self, patient_profile: Dict, student_diagnosis: str,
+                            questions_asked: List[str], reasoning: str,
+                            profile_text: Dict[str, str] = None) -> str:
+        """Build the evaluation prompt for one student submission"""
+        profile_text = profile_text or profile_strings(patient_profile)
+        numbered_questions = "\n".join(f"{i+1}. {q}" for i, q in enumerate(questions_asked))
 
-        context = f"""
+        return f"""
 CORRECT DIAGNOSIS: {patient_profile['probable_diagnosis']}
-DIFFERENTIAL DIAGNOSES: {', '.join(patient_profile['differential_diagnoses'])}
+DIFFERENTIAL DIAGNOSES: {profile_text['ddx']}
 
 STUDENT'S DIAGNOSIS: {student_diagnosis}
 STUDENT'S REASONING: {reasoning}
@@ -252,7 +684,7 @@ STUDENT'S REASONING: {reasoning}
 NUMBER OF QUESTIONS ASKED: {len(questions_asked)}
 
 QUESTIONS ASKED BY STUDENT:
-{chr(10).join(f"{i+1}. {q}" for i, q in enumerate(questions_asked))}
+{numbered_questions}
 
 PATIENT INFORMATION:
 - Chief Complaint: {patient_profile['chief_complaint']}
@@ -262,7 +694,7 @@ PATIENT INFORMATION:
               HR {patient_profile['vital_signs']['heart_rate']},
               Temp {patient_profile['vital_signs']['temperature']}
 - Physical Exam: {patient_profile['physical_exam_findings'][:200]}...
-- Past Medical History: {', '.join(patient_profile['past_medical_history'])}
+- Past Medical History: {profile_text['pmh']}
 
 EVALUATION CRITERIA:
 1. Diagnostic Accuracy: Is the diagnosis correct or in the differential?
@@ -275,29 +707,86 @@ Provide a thorough evaluation with specific examples. Score from 0-100.
 Be constructive and educational in your feedback.
 """
 
-        response = self.prompt_llama3(context)
-        return json.loads(response)
+    def evaluate(self, patient_profile: Dict, student_diagnosis: str,
+                 questions_asked: List[str], reasoning: str,
+                 profile_text: Dict[str, str] = None) -> Dict:
+        """Comprehensive evaluation of student performance"""
+        context = self._evaluation_context(patient_profile, student_diagnosis, questions_asked,
+                                           reasoning, profile_text)
+        return self.prompt_llama3(context).model_dump()
+
+    def evaluate_stream(self, patient_profile: Dict, student_diagnosis: str,
+                        questions_asked: List[str], reasoning: str,
+                        profile_text: Dict[str, str] = None) -> Iterator[str]:
+        """Yield the evaluation feedback as it is generated
+
+        The complete evaluation is available as last_evaluation once the
+        generator is exhausted.
+        """
+        context = self._evaluation_context(patient_profile, student_diagnosis, questions_asked,
+                                           reasoning, profile_text)
+        evaluation = yield from self.stream_field(context, "feedback")
+        self.last_evaluation = evaluation.model_dump()
+
+    def evaluate_batch(self, cases: List[Dict]) -> List[Dict]:
+        """Evaluate several submissions concurrently
+
+        Each case is a dict with the keyword arguments of evaluate():
+        patient_profile, student_diagnosis, questions_asked and reasoning.
+        """
+        contexts = [self._evaluation_context(**case) for case in cases]
+        return [response.model_dump() for response in self.prompt_llama3_batch(contexts)]
 
 class PatientSessionManager:
     """Manages the entire patient encounter session"""
 
     def __init__(self):
         self.current_patient = None
+        self._profile_strings = None
+        self.compact_persona = None
         self.conversation_handler = None
         self.questions_asked = []
         self.session_start_time = None
         self.vitals_checked = False
         self.physical_exam_performed = []
+        self.next_topic = None
+        self.reply_timeout = DEFAULT_REPLY_TIMEOUT
+        self.max_concurrent = DEFAULT_MAX_CONCURRENT
+        # Random cases rotate through CASE_CONDITIONS from a random start, so the next one is predictable
+        self._condition_index = random.randrange(len(CASE_CONDITIONS))
+        self._next_patient_future: Future = None
+        # Resolved here on the script thread so background work never touches st.cache_resource
+        self.executor = get_executor()
+        self.last_response = None
+        self.last_diagnosis_result = None
+        self._question_cache: Dict[bytes, Dict] = {}
 
     def start_new_session(self, disease_or_symptoms: str) -> Dict:
         """Initialize a new patient case"""
-        generator = VirtualPatientGenerator()
-        self.current_patient = generator.generate_patient(disease_or_symptoms)
-        self.conversation_handler = PatientConversationHandler(self.current_patient)
+        self.current_patient = None
+        if self._next_patient_future is not None and disease_or_symptoms == self.next_topic:
+            # An in-flight prefetch is always closer to done than a fresh request
+            try:
+                self.current_patient = self._next_patient_future.result()
+            except Exception:
+                self.current_patient = None
+            self._next_patient_future = None
+        if self.current_patient is None:
+            generator = self._limited(VirtualPatientGenerator())
+            self.current_patient = generator.generate_patient(disease_or_symptoms)
+        self._profile_strings = profile_strings(self.current_patient)
+        self.compact_persona = build_compact_persona(self.current_patient, self._profile_strings)
+        self.conversation_handler = self._limited(PatientConversationHandler(
+            self.current_patient, self._profile_strings, self.compact_persona
+        ))
+        self.conversation_handler.request_timeout = self.reply_timeout
         self.questions_asked = []
         self.session_start_time = datetime.now()
         self.vitals_checked = False
         self.physical_exam_performed = []
+        self._question_cache = {}
+
+        self._prefetch_next_patient()
 
         return {
             "patient_id": self.current_patient["patient_id"],
@@ -306,12 +795,77 @@ class PatientSessionManager:
             "gender": self.current_patient["gender"]
         }
 
+    def configure(self, reply_timeout: float, max_concurrent: int):
+        """Apply the sidebar request settings to this session and its current conversation"""
+        self.reply_timeout = reply_timeout
+        self.max_concurrent = max_concurrent
+        if self.conversation_handler is not None:
+            self.conversation_handler.request_timeout = reply_timeout
+            self.conversation_handler.limit_concurrency(max_concurrent)
+
+    def _limited(self, processor: Llama3Processor) -> Llama3Processor:
+        """Apply this session's concurrency cap to a new processor"""
+        processor.limit_concurrency(self.max_concurrent)
+        return processor
+
+    def rotate_condition(self) -> str:
+        """Take the next condition in the random-case rotation"""
+        condition = CASE_CONDITIONS[self._condition_index % len(CASE_CONDITIONS)]
+        self._condition_index += 1
+        return condition
+
+    def _prefetch_next_patient(self):
+        """Generate the next random case in the background while the student works"""
+        topic = CASE_CONDITIONS[self._condition_index % len(CASE_CONDITIONS)]
+        future = self._next_patient_future
+        # A typed condition leaves the rotation where it was, so an unconsumed prefetch is still wanted
+        if (future is not None and topic == self.next_topic
+                and not (future.done() and (future.cancelled() or future.exception() is not None))):
+            return
+        self.next_topic = topic
+        self._next_patient_future = self.executor.submit(
+            self._limited(VirtualPatientGenerator()).generate_patient, self.next_topic
+        )
+
+    def _lookup_question(self, question: str):
+        """Return the question's embedding key and the cached answer to a near-identical question"""
+        model = get_embedding_model()
+        if model is None:
+            return None, None
+
+        import numpy as np
+
+        embedding = model.encode(question, normalize_embeddings=True)
+        for key, response in self._question_cache.items():
+            if float(np.dot(np.frombuffer(key, dtype=embedding.dtype), embedding)) > QUESTION_SIMILARITY_THRESHOLD:
+                return key, {**response, "repeated": True}
+        return embedding.tobytes(), None
+
     def ask_question(self, question: str) -> Dict:
         """Student asks patient a question"""
         self.questions_asked.append(question)
-        response = self.conversation_handler.respond_to_question(question)
+        key, response = self._lookup_question(question)
+        if response is None:
+            response = self.conversation_handler.respond_to_question(question)
+            if key is not None:
+                self._question_cache[key] = response
+        self.last_response = response
         return response
 
+    def ask_question_stream(self, question: str) -> Iterator[str]:
+        """Student asks patient a question, streaming the spoken answer"""
+        self.questions_asked.append(question)
+        key, response = self._lookup_question(question)
+        if response is not None:
+            self.last_response = response
+            yield response["response_text"]
+            return
+
+        yield from self.conversation_handler.respond_to_question_stream(question)
+        self.last_response = self.conversation_handler.last_response
+        if key is not None:
+            self._question_cache[key] = self.last_response
+
     def get_vital_signs(self) -> Dict:
         """Simulate taking vital signs"""
         self.vitals_checked = True
@@ -319,22 +873,42 @@ class PatientSessionManager:
 
     def perform_physical_exam(self, exam_type: str) -> str:
         """Simulate physical examination"""
-        self.physical_exam_performed.append(exam_type)
+        if exam_type not in self.physical_exam_performed:
+            self.physical_exam_performed.append(exam_type)
         findings = self.current_patient["physical_exam_findings"]
         return findings
 
     def submit_diagnosis(self, diagnosis: str, reasoning: str) -> Dict:
         """Evaluate student's diagnosis"""
-        evaluator = DiagnosticEvaluator()
+        evaluator = self._limited(DiagnosticEvaluator())
         evaluation = evaluator.evaluate(
             self.current_patient,
             diagnosis,
             self.questions_asked,
-            reasoning
+            reasoning,
+            self._profile_strings
         )
 
-        eval_data = evaluation
+        return self._diagnosis_result(diagnosis, evaluation)
+
+    def submit_diagnosis_stream(self, diagnosis: str, reasoning: str) -> Iterator[str]:
+        """Evaluate student's diagnosis, streaming the feedback text
 
+        The full result is available as last_diagnosis_result once the
+        generator is exhausted.
+        """
+        evaluator = self._limited(DiagnosticEvaluator())
+        yield from evaluator.evaluate_stream(
+            self.current_patient,
+            diagnosis,
+            self.questions_asked,
+            reasoning,
+            self._profile_strings
+        )
+        self.last_diagnosis_result = self._diagnosis_result(diagnosis, evaluator.last_evaluation)
+
+    def _diagnosis_result(self, diagnosis: str, eval_data: Dict) -> Dict:
+        """Combine an evaluation with the case answer and session statistics"""
         duration = datetime.now() - self.session_start_time
 
         return {
@@ -347,44 +921,153 @@ class PatientSessionManager:
                 "vitals_checked": self.vitals_checked,
                 "physical_exams": self.physical_exam_performed,
                 "duration_minutes": duration.total_seconds() / 60,
-                "revealed_info": list(self.conversation_handler.revealed_information)
+                "revealed_info": list(self.conversation_handler.revealed_information.values())
             }
         }
 
     def get_hint(self) -> str:
         """Provide a subtle learning hint"""
-        hints = [
-            "Consider asking about the onset and progression of symptoms.",
-            "Have you checked the patient's vital signs?",
-            "Think about risk factors relevant to this age group.",
-            "Consider asking about associated symptoms.",
-            "What about the patient's past medical history?",
-            "Are there any red flags that require immediate attention?",
-            "Consider the patient's medications - any relevant interactions?",
-            "Think about the differential diagnoses for this presentation.",
-        ]
-        return random.choice(hints)
+        return HINTS[random.randrange(len(HINTS))]
 
 # ============================================================================
 # STREAMLIT APP
 # ============================================================================
 
+APP_CSS = """
+<style>
+.main-header {
+    font-size: 2.5rem;
+    color: #1e88e5;
+    text-align: center;
+    padding: 1rem;
+    border-bottom: 3px solid #1e88e5;
+    margin-bottom: 2rem;
+}
+</style>
+"""
+
+INSTRUCTIONS_MD = """
+1. **Start a Case**: Enter a condition or symptom
+2. **Interview**: Ask the patient questions
+3. **Examine**: Check vitals and perform exams
+4. **Diagnose**: Submit your diagnosis with reasoning
+5. **Review**: Get detailed feedback
+"""
+
+CHAT_HISTORY_WINDOW = 50
+
+def bullet_list(items: tuple) -> str:
+    """One markdown block for a list, so it renders as a single element"""
+    return "  \n".join(f"• {item}" for item in items)
+
+def render_chat_message(msg: Dict):
+    """Render one interview message as a chat bubble"""
+    if msg['type'] == 'student':
+        with st.chat_message("user", avatar="👨‍⚕️"):
+            st.markdown(msg["text"])
+    else:
+        with st.chat_message("assistant", avatar="🗣️"):
+            st.markdown(msg["text"])
+            if msg.get("repeated"):
+                st.caption("🔁 Repeated question - same answer as before")
+
+HISTORY_ARCHIVE_CSS = """
+<style>
+    body { font-family: sans-serif; margin: 0; }
+    .msg { padding: 0.6rem 0.8rem; border-radius: 8px; margin-bottom: 0.5rem; color: #000000; }
+    .student { background-color: #e3f2fd; border-left: 4px solid #1e88e5; }
+    .patient { background-color: #fff3e0; border-left: 4px solid #ff9800; }
+</style>
+"""
+
+def render_history_archive(messages: List[Dict], height: int = 300):
+    """Render older messages as one pre-escaped HTML block in a scrolling iframe
+
+    The browser lays out a single static document instead of one widget per
+    message, so long interviews stay cheap to rerender.
+    """
+    rows = []
+    for msg in messages:
+        if msg['type'] == 'student':
+            rows.append(f'<div class="msg student"><strong>👨‍⚕️ You:</strong> {html.escape(msg["text"])}</div>')
+        else:
+            rows.append(f'<div class="msg patient"><strong>🗣️ Patient:</strong> {html.escape(msg["text"])}</div>')
+    # Open scrolled to the bottom so the archive reads into the live messages below it
+    components.html(
+        HISTORY_ARCHIVE_CSS + "".join(rows) + "<script>window.scrollTo(0, document.body.scrollHeight);</script>",
+        height=height,
+        scrolling=True,
+    )
+
+SESSION_DEFAULTS = {
+    'api_key': None,
+    'session_manager': None,
+    'patient_loaded': False,
+    'chat_history': [],
+    'diagnosis_submitted': False,
+    'vitals_displayed': False,
+    'exam_results': [],
+    'request_timeout': DEFAULT_REPLY_TIMEOUT,
+    'max_concurrent': min(max(DEFAULT_MAX_CONCURRENT, 2), 16),
+}
+
+@st.fragment
+def interview_fragment(manager: PatientSessionManager):
+    """Interview tab; asking a question reruns only this fragment, not the whole page"""
+    st.subheader("Patient Interview")
+
+    # Chat history; new turns are appended here in place as they stream
+    window = st.number_input(
+        "History window",
+        min_value=2,
+        max_value=500,
+        value=CHAT_HISTORY_WINDOW,
+        step=2,
+        help="Number of recent messages shown as chat bubbles; older ones are archived above"
+    )
+    chat_container = st.container()
+    with chat_container:
+        history = st.session_state.chat_history
+        earlier, recent = history[:-window], history[-window:]
+        if earlier:
+            st.caption(f"Earlier history ({len(earlier)} messages)")
+            render_history_archive(earlier)
+        for msg in recent:
+            render_chat_message(msg)
+
+    if st.button("💡 Get Hint"):
+        hint = manager.get_hint()
+        st.info(f"💭 {hint}")
+
+    question = st.chat_input("Ask the patient a question, e.g. When did your symptoms start?")
+
+    if question:
+        with chat_container:
+            with st.chat_message("user", avatar="👨‍⚕️"):
+                st.markdown(question)
+            try:
+                with st.chat_message("assistant", avatar="🗣️"):
+                    st.write_stream(manager.ask_question_stream(question))
+                    response = manager.last_response
+                    if response.get('repeated'):
+                        st.caption("🔁 Repeated question - same answer as before")
+                st.session_state.chat_history.append({
+                    'type': 'student',
+                    'text': question
+                })
+                st.session_state.chat_history.append({
+                    'type': 'patient',
+                    'text': response['response_text'],
+                    'repeated': response.get('repeated', False)
+                })
+            except llm_errors() as e:
+                st.error(f"❌ Error: {str(e)}")
+
 def initialize_session_state():
     """Initialize Streamlit session state variables"""
-    if 'api_key' not in st.session_state:
-        st.session_state.api_key = None
-    if 'session_manager' not in st.session_state:
-        st.session_state.session_manager = None
-    if 'patient_loaded' not in st.session_state:
-        st.session_state.patient_loaded = False
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-    if 'diagnosis_submitted' not in st.session_state:
-        st.session_state.diagnosis_submitted = False
-    if 'vitals_displayed' not in st.session_state:
-        st.session_state.vitals_displayed = False
-    if 'exam_results' not in st.session_state:
-        st.session_state.exam_results = []
+    for key, value in SESSION_DEFAULTS.items():
+        # Copy so mutable defaults like lists are never shared between sessions
+        st.session_state.setdefault(key, copy.copy(value))
 
 def main():
     st.set_page_config(
@@ -394,74 +1077,7 @@ def main():
     )
 
     # Custom CSS - Fixed for better visibility
-    st.markdown("""
-        <style>
-        .main-header {
-            font-size: 2.5rem;
-            color: #1e88e5;
-            text-align: center;
-            padding: 1rem;
-            border-bottom: 3px solid #1e88e5;
-            margin-bottom: 2rem;
-        }
-        .patient-card {
-            background-color: #e3f2fd;
-            padding: 1.5rem;
-            border-radius: 10px;
-            border-left: 5px solid #1e88e5;
-            margin-bottom: 1rem;
-            color: #000000;
-        }
-        .patient-card h3 {
-            color: #1565c0;
-            margin-bottom: 1rem;
-        }
-        .patient-card p {
-            color: #000000;
-            margin: 0.5rem 0;
-        }
-        .student-msg {
-            background-color: #e3f2fd;
-            padding: 1rem;
-            border-radius: 10px;
-            border-left: 4px solid #1e88e5;
-            margin-bottom: 1rem;
-            color: #000000;
-        }
-        .patient-msg {
-            background-color: #fff3e0;
-            padding: 1rem;
-            border-radius: 10px;
-            border-left: 4px solid #ff9800;
-            margin-bottom: 1rem;
-            color: #000000;
-        }
-        .vitals-container {
-            background-color: #e8f5e9;
-            padding: 1.5rem;
-            border-radius: 10px;
-            border-left: 4px solid #4caf50;
-            margin: 1rem 0;
-        }
-        .vitals-container h4 {
-            color: #2e7d32;
-            margin-bottom: 1rem;
-        }
-        .vitals-container p {
-            color: #000000;
-            margin: 0.5rem 0;
-            font-size: 1.1rem;
-        }
-        .exam-result {
-            background-color: #f3e5f5;
-            padding: 1rem;
-            border-radius: 8px;
-            border-left: 4px solid #9c27b0;
-            margin: 1rem 0;
-            color: #000000;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
     initialize_session_state()
 
@@ -481,26 +1097,39 @@ def main():
         
         if api_key:
             st.session_state.api_key = api_key
-            Llama3Processor.client = Groq(api_key=api_key)
+            Llama3Processor.client = get_groq_client(api_key)
+            Llama3Processor.async_client = get_async_groq_client(api_key)
             st.success("✅ API Key configured")
+
+            # Kept in session_state: each rerun redefines the classes, so class attributes would not reach
+            # the session manager and handlers created on earlier runs
+            st.session_state.request_timeout = st.number_input(
+                "Patient reply timeout (seconds)",
+                min_value=2.0,
+                max_value=60.0,
+                value=st.session_state.request_timeout,
+                step=1.0,
+                help="Slow patient replies are cancelled and retried once after this long"
+            )
+            st.session_state.max_concurrent = int(st.number_input(
+                "Max concurrent LLM requests",
+                min_value=2,  # the next-case prefetch holds a slot, so 1 would queue questions behind it
+                max_value=16,
+                value=st.session_state.max_concurrent,
+                step=1,
+                help="Extra requests wait their turn instead of hitting Groq rate limits"
+            ))
         else:
             st.warning("⚠️ Please enter your Groq API key to continue")
             return
 
         st.divider()
         st.header("📋 Instructions")
-        st.markdown("""
-        1. **Start a Case**: Enter a condition or symptom
-        2. **Interview**: Ask the patient questions
-        3. **Examine**: Check vitals and perform exams
-        4. **Diagnose**: Submit your diagnosis with reasoning
-        5. **Review**: Get detailed feedback
-        """)
+        st.markdown(INSTRUCTIONS_MD)
 
         if st.session_state.patient_loaded:
             st.divider()
             if st.button("🔄 Start New Case", use_container_width=True):
-                st.session_state.session_manager = None
                 st.session_state.patient_loaded = False
                 st.session_state.chat_history = []
                 st.session_state.diagnosis_submitted = False
@@ -525,86 +1154,46 @@ def main():
             generate_button = st.button("🚀 Generate Case", use_container_width=True)
 
         if generate_button:
+            # Reuse the manager so a case prefetched during the last encounter can be served instantly
+            if st.session_state.session_manager is None:
+                st.session_state.session_manager = PatientSessionManager()
+            manager = st.session_state.session_manager
+            manager.configure(st.session_state.request_timeout, st.session_state.max_concurrent)
+
             if not condition:
-                conditions = ["hypertension", "diabetes", "chest pain", "headache", 
-                            "fever", "abdominal pain", "shortness of breath"]
-                condition = random.choice(conditions)
+                condition = manager.rotate_condition()
             
             with st.spinner(f"🔬 Generating patient case for: **{condition.upper()}**..."):
                 try:
-                    st.session_state.session_manager = PatientSessionManager()
                     patient_info = st.session_state.session_manager.start_new_session(condition)
                     st.session_state.patient_loaded = True
-                    st.rerun()
                 except Exception as e:
                     st.error(f"❌ Error generating case: {str(e)}")
+                else:
+                    # st.rerun() raises to stop the script, so it must not run inside the try
+                    st.rerun()
 
     else:
         # Display Patient Information
         manager = st.session_state.session_manager
+        manager.configure(st.session_state.request_timeout, st.session_state.max_concurrent)
         patient = manager.current_patient
 
         # Patient Card
-        st.markdown(f"""
-        <div class="patient-card">
-            <h3>👤 Patient Information</h3>
-            <p><strong>ID:</strong> {patient['patient_id']}</p>
-            <p><strong>Age:</strong> {patient['age']} years</p>
-            <p><strong>Gender:</strong> {patient['gender']}</p>
-            <p><strong>Chief Complaint:</strong> "{patient['chief_complaint']}"</p>
-        </div>
-        """, unsafe_allow_html=True)
+        with st.container(border=True):
+            st.markdown("### 👤 Patient Information")
+            st.markdown(
+                f"**ID:** {patient['patient_id']}  \n"
+                f"**Age:** {patient['age']} years  \n"
+                f"**Gender:** {patient['gender']}  \n"
+                f"**Chief Complaint:** \"{patient['chief_complaint']}\""
+            )
 
         # Tabs for different actions
         tab1, tab2, tab3, tab4 = st.tabs(["💬 Interview", "📊 Vitals & Exam", "🩺 Diagnosis", "📈 Summary"])
 
         with tab1:
-            st.subheader("Patient Interview")
-            
-            # Display chat history with proper styling
-            chat_container = st.container()
-            with chat_container:
-                for msg in st.session_state.chat_history:
-                    if msg['type'] == 'student':
-                        st.markdown(f"""
-                        <div class="student-msg">
-                            <strong>👨‍⚕️ You:</strong> {msg["text"]}
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                        <div class="patient-msg">
-                            <strong>🗣️ Patient:</strong> {msg["text"]}
-                        </div>
-                        """, unsafe_allow_html=True)
-
-            # Question input
-            st.write("")
-            question = st.text_input("Ask the patient a question:", key="question_input", placeholder="e.g., When did your symptoms start?")
-            
-            col1, col2 = st.columns([1, 4])
-            with col1:
-                if st.button("💡 Get Hint", use_container_width=True):
-                    hint = manager.get_hint()
-                    st.info(f"💭 {hint}")
-            with col2:
-                ask_btn = st.button("📤 Ask Question", use_container_width=True, type="primary", disabled=not question)
-                
-            if ask_btn and question:
-                with st.spinner("🤔 Patient is thinking..."):
-                    try:
-                        response = manager.ask_question(question)
-                        st.session_state.chat_history.append({
-                            'type': 'student',
-                            'text': question
-                        })
-                        st.session_state.chat_history.append({
-                            'type': 'patient',
-                            'text': response['response_text']
-                        })
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+            interview_fragment(manager)
 
         with tab2:
             st.subheader("Vital Signs & Physical Examination")
@@ -619,16 +1208,15 @@ def main():
                 
                 if st.session_state.vitals_displayed and 'current_vitals' in st.session_state:
                     vitals = st.session_state.current_vitals
-                    st.markdown(f"""
-                    <div class="vitals-container">
-                        <h4>📊 Vital Signs</h4>
-                        <p>🌡️ <strong>Temperature:</strong> {vitals['temperature']}</p>
-                        <p>💓 <strong>Blood Pressure:</strong> {vitals['blood_pressure']}</p>
-                        <p>❤️ <strong>Heart Rate:</strong> {vitals['heart_rate']}</p>
-                        <p>🫁 <strong>Respiratory Rate:</strong> {vitals['respiratory_rate']}</p>
-                        <p>💨 <strong>Oxygen Saturation:</strong> {vitals['oxygen_saturation']}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    with st.container(border=True):
+                        st.markdown("#### 📊 Vital Signs")
+                        st.markdown(
+                            f"🌡️ **Temperature:** {vitals['temperature']}  \n"
+                            f"💓 **Blood Pressure:** {vitals['blood_pressure']}  \n"
+                            f"❤️ **Heart Rate:** {vitals['heart_rate']}  \n"
+                            f"🫁 **Respiratory Rate:** {vitals['respiratory_rate']}  \n"
+                            f"💨 **Oxygen Saturation:** {vitals['oxygen_saturation']}"
+                        )
             
             with col2:
                 exam_area = st.selectbox(
@@ -637,43 +1225,52 @@ def main():
                 )
                 if st.button("🔍 Perform Examination", use_container_width=True):
                     findings = manager.perform_physical_exam(exam_area)
-                    st.session_state.exam_results.append({
-                        'area': exam_area,
-                        'findings': findings
-                    })
+                    # Findings are fixed per case, so a repeated exam only re-shows the existing result
+                    if all(exam['area'] != exam_area for exam in st.session_state.exam_results):
+                        st.session_state.exam_results.append({
+                            'area': exam_area,
+                            'findings': findings
+                        })
             
             # Display exam results
             if st.session_state.exam_results:
                 st.write("---")
                 for exam in st.session_state.exam_results:
-                    st.markdown(f"""
-                    <div class="exam-result">
-                        <strong>🔍 {exam['area']} Examination:</strong><br>
-                        {exam['findings']}
-                    </div>
-                    """, unsafe_allow_html=True)
+                    with st.container(border=True):
+                        st.markdown(f"**🔍 {exam['area']} Examination:**")
+                        st.write(exam['findings'])
 
         with tab3:
             st.subheader("Submit Your Diagnosis")
             
             if not st.session_state.diagnosis_submitted:
-                diagnosis = st.text_input("Primary Diagnosis:", placeholder="Enter your diagnosis")
-                reasoning = st.text_area(
-                    "Clinical Reasoning:",
-                    placeholder="Explain your reasoning, key findings, and why you ruled out differentials...",
-                    height=150
-                )
-                
-                if st.button("✅ Submit Diagnosis", disabled=not (diagnosis and reasoning), use_container_width=True, type="primary"):
-                    if diagnosis and reasoning:
-                        with st.spinner("⏳ Evaluating your diagnosis..."):
-                            try:
-                                result = manager.submit_diagnosis(diagnosis, reasoning)
-                                st.session_state.diagnosis_result = result
-                                st.session_state.diagnosis_submitted = True
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"❌ Error: {str(e)}")
+                # A form defers reruns until submit instead of rerunning on every edit
+                with st.form("diagnosis_form", clear_on_submit=False):
+                    diagnosis = st.text_input("Primary Diagnosis:", placeholder="Enter your diagnosis")
+                    reasoning = st.text_area(
+                        "Clinical Reasoning:",
+                        placeholder="Explain your reasoning, key findings, and why you ruled out differentials...",
+                        height=150
+                    )
+                    submitted = st.form_submit_button("✅ Submit Diagnosis", use_container_width=True, type="primary")
+
+                if submitted:
+                    if not (diagnosis and reasoning):
+                        st.warning("⚠️ Please enter both a diagnosis and your clinical reasoning.")
+                    else:
+                        try:
+                            st.markdown("**💬 Detailed Feedback:**")
+                            placeholder = st.empty()
+                            feedback = ""
+                            for token in manager.submit_diagnosis_stream(diagnosis, reasoning):
+                                feedback += token
+                                placeholder.markdown(feedback)
+                            st.session_state.diagnosis_result = manager.last_diagnosis_result
+                            st.session_state.diagnosis_submitted = True
+                        except llm_errors() as e:
+                            st.error(f"❌ Error: {str(e)}")
+                        else:
+                            st.rerun()
             else:
                 # Display evaluation results
                 result = st.session_state.diagnosis_result
@@ -692,8 +1289,7 @@ def main():
                     st.warning(f"**📋 Your Diagnosis:**\n\n{result['student_diagnosis']}")
                 
                 st.markdown("**📊 Differential Diagnoses:**")
-                for diff in result['differential_diagnoses']:
-                    st.write(f"• {diff}")
+                st.markdown(bullet_list(tuple(result['differential_diagnoses'])))
                 
                 st.divider()
                 st.markdown("**💬 Detailed Feedback:**")
@@ -702,18 +1298,15 @@ def main():
                 col1, col2 = st.columns(2)
                 with col1:
                     st.success("**✨ Strengths:**")
-                    for strength in eval_data['strengths']:
-                        st.write(f"• {strength}")
+                    st.markdown(bullet_list(tuple(eval_data['strengths'])))
                 
                 with col2:
                     st.info("**📚 Areas for Improvement:**")
-                    for area in eval_data['areas_for_improvement']:
-                        st.write(f"• {area}")
+                    st.markdown(bullet_list(tuple(eval_data['areas_for_improvement'])))
                 
                 if eval_data['key_findings_missed']:
                     st.warning("**⚠️ Key Findings Missed:**")
-                    for finding in eval_data['key_findings_missed']:
-                        st.write(f"• {finding}")
+                    st.markdown(bullet_list(tuple(eval_data['key_findings_missed'])))
 
         with tab4:
             st.subheader("Session Summary")
@@ -739,8 +1332,7 @@ def main():
             if stats and stats['revealed_info']:
                 st.write("---")
                 st.markdown("**📝 Information Gathered:**")
-                for info in stats['revealed_info']:
-                    st.write(f"• {info}")
+                st.markdown(bullet_list(tuple(stats['revealed_info'])))
             
             # Display conversation summary
             if st.session_state.chat_history:
@@ -0,0 +1,60 @@
+from app import normalize_info, partial_json_string
+
+
+def test_normalize_info_matches_rephrased_fact():
+    assert normalize_info("headache for 2 days") == normalize_info("2-day headache")
+
+
+def test_normalize_info_ignores_case_and_stopwords():
+    assert normalize_info("The patient has a Fever") == normalize_info("fever")
+
+
+def test_normalize_info_keeps_negations():
+    assert normalize_info("no fever") != normalize_info("fever")
+    assert normalize_info("has diabetes") != normalize_info("no diabetes")
+    assert normalize_info("not a smoker") != normalize_info("smoker")
+    assert normalize_info("denies chest pain") != normalize_info("chest pain")
+    assert normalize_info("cough without sputum") != normalize_info("cough with sputum")
+
+
+def test_partial_json_string_missing_key():
+    assert partial_json_string('{"emotional_tone": "calm", "resp', "response_text") == ""
+
+
+def test_partial_json_string_open_and_closed_values():
+    assert partial_json_string('{"response_text": "It hurts', "response_text") == "It hurts"
+    assert partial_json_string('{"response_text": "It hurts", "reveals', "response_text") == "It hurts"
+
+
+def test_partial_json_string_escapes():
+    document = r'{"response_text": "She said \"ouch\"\\\nthen left"}'
+    assert partial_json_string(document, "response_text") == 'She said "ouch"\\\nthen left'
+
+
+def test_partial_json_string_drops_split_escapes():
+    assert partial_json_string('{"response_text": "a\\', "response_text") == "a"
+    escaped = "\\u00e9"
+    for end in range(len(escaped)):
+        assert partial_json_string('{"response_text": "caf' + escaped[:end], "response_text") == "caf"
+    assert partial_json_string('{"response_text": "caf' + escaped, "response_text") == "café"
+
+
+def test_partial_json_string_holds_back_high_surrogate():
+    escaped = "\\ud83d\\ude00"
+    prefix = '{"response_text": "I feel '
+    for end in range(len(escaped)):
+        value = partial_json_string(prefix + escaped[:end], "response_text")
+        assert value == "I feel "
+        value.encode("utf-8")
+    assert partial_json_string(prefix + escaped + ' ok"}', "response_text") == "I feel \U0001F600 ok"
+
+
+def test_partial_json_string_prefixes_only_grow():
+    document = '{"response_text": "Caf\\u00e9 \\ud83d\\ude00 \\"yes\\"\\\\no", "emotional_tone": "calm"}'
+    previous = ""
+    for end in range(len(document) + 1):
+        value = partial_json_string(document[:end], "response_text")
+        assert value.startswith(previous)
+        value.encode("utf-8")
+        previous = value
+    assert previous == 'Café \U0001F600 "yes"\\no'
@@ -0,0 +1,119 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import VirtualPatientGenerator
+
+CONDITIONS = ["diabetes", "chest pain", "headache"]
+
+
+def _profile(patient_id: str) -> dict:
+    return {
+        "patient_id": patient_id,
+        "age": 54,
+        "gender": "Female",
+        "chief_complaint": "I keep getting thirsty",
+        "history_of_present_illness": "Three months of thirst and frequent urination",
+        "past_medical_history": ["hypertension"],
+        "medications": ["lisinopril 10 mg daily"],
+        "allergies": [],
+        "family_history": ["type 2 diabetes"],
+        "social_history": "Office worker, never smoked",
+        "vital_signs": {
+            "temperature": "98.6°F",
+            "blood_pressure": "138/86 mmHg",
+            "heart_rate": "82 bpm",
+            "respiratory_rate": "16/min",
+            "oxygen_saturation": "98%",
+        },
+        "physical_exam_findings": "Dry mucous membranes",
+        "probable_diagnosis": "Type 2 diabetes mellitus",
+        "differential_diagnoses": ["diabetes insipidus", "hypercalcemia"],
+        "recommended_tests": ["HbA1c", "fasting glucose"],
+        "red_flags": [],
+        "patient_personality": "cooperative",
+    }
+
+
+def _success(custom_id: int) -> dict:
+    content = json.dumps(_profile(f"P-{custom_id}"))
+    return {
+        "custom_id": str(custom_id),
+        "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}},
+        "error": None,
+    }
+
+
+def _failure(custom_id: int) -> dict:
+    return {
+        "custom_id": str(custom_id),
+        "response": None,
+        "error": {"code": "internal_error", "message": "model overloaded"},
+    }
+
+
+def _jsonl(results: list) -> str:
+    return "\n".join(json.dumps(result) for result in results) + "\n"
+
+
+def _generator(output: list = None, errors: list = None) -> VirtualPatientGenerator:
+    """Generator whose client serves a completed batch with canned output and error files"""
+    contents = {}
+    batch = SimpleNamespace(id="batch-1", status="completed", output_file_id=None, error_file_id=None)
+    if output is not None:
+        batch.output_file_id = "file-output"
+        contents["file-output"] = _jsonl(output)
+    if errors is not None:
+        batch.error_file_id = "file-errors"
+        contents["file-errors"] = _jsonl(errors)
+
+    generator = VirtualPatientGenerator()
+    generator.client = SimpleNamespace(
+        files=SimpleNamespace(
+            create=lambda **kwargs: SimpleNamespace(id="file-input"),
+            content=lambda file_id: SimpleNamespace(text=lambda: contents[file_id]),
+        ),
+        batches=SimpleNamespace(
+            create=lambda **kwargs: batch,
+            retrieve=lambda batch_id: batch,
+        ),
+    )
+    return generator
+
+
+def test_generate_patients_batch_orders_results_by_custom_id():
+    generator = _generator(output=[_success(2), _success(0), _success(1)])
+
+    patients = generator.generate_patients_batch(CONDITIONS, poll_interval=0)
+
+    assert [patient["patient_id"] for patient in patients] == ["P-0", "P-1", "P-2"]
+
+
+def test_generate_patients_batch_raises_for_items_in_the_error_file():
+    generator = _generator(output=[_success(0), _success(2)], errors=[_failure(1)])
+
+    with pytest.raises(RuntimeError, match="1 of 3 conditions: 'chest pain': .*model overloaded"):
+        generator.generate_patients_batch(CONDITIONS, poll_interval=0)
+
+
+def test_generate_patients_batch_raises_for_failed_status_in_the_output_file():
+    rejected = {"custom_id": "0", "response": {"status_code": 400, "body": {"error": "bad request"}}, "error": None}
+    generator = _generator(output=[rejected, _success(1), _success(2)])
+
+    with pytest.raises(RuntimeError, match="'diabetes': .*bad request"):
+        generator.generate_patients_batch(CONDITIONS, poll_interval=0)
+
+
+def test_generate_patients_batch_raises_for_missing_items():
+    generator = _generator(output=[_success(0), _success(1)])
+
+    with pytest.raises(RuntimeError, match="'headache': no result returned"):
+        generator.generate_patients_batch(CONDITIONS, poll_interval=0)
+
+
+def test_generate_patients_batch_raises_when_every_item_failed():
+    generator = _generator(errors=[_failure(0), _failure(1), _failure(2)])
+
+    with pytest.raises(RuntimeError, match="3 of 3 conditions"):
+        generator.generate_patients_batch(CONDITIONS, poll_interval=0)
@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import app
+from app import PatientSessionManager
+
+
+def _profile(condition: str) -> dict:
+    return {
+        "patient_id": f"P-{condition}",
+        "age": 47,
+        "gender": "Male",
+        "chief_complaint": f"Something is wrong ({condition})",
+        "history_of_present_illness": "Started two days ago",
+        "past_medical_history": [],
+        "medications": [],
+        "differential_diagnoses": [],
+        "social_history": "Teacher, drinks socially",
+        "physical_exam_findings": "Unremarkable",
+        "patient_personality": "cooperative",
+    }
+
+
+class FakeExecutor:
+    """Records submissions and hands back futures the test resolves itself"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.submitted.append((args, future))
+        return future
+
+
+class StubGenerator:
+    generated = []
+
+    def limit_concurrency(self, max_concurrent: int):
+        pass
+
+    def generate_patient(self, condition: str) -> dict:
+        StubGenerator.generated.append(condition)
+        return _profile(condition)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    StubGenerator.generated = []
+    monkeypatch.setattr(app, "VirtualPatientGenerator", StubGenerator)
+    manager = PatientSessionManager()
+    manager.executor = FakeExecutor()
+    return manager
+
+
+def test_typed_condition_keeps_pending_prefetch(manager):
+    manager.start_new_session("sepsis")
+    manager.start_new_session("migraine")
+    manager.start_new_session("gout")
+
+    assert StubGenerator.generated == ["sepsis", "migraine", "gout"]
+    assert [args for args, _ in manager.executor.submitted] == [(manager.next_topic,)]
+
+
+def test_consumed_prefetch_is_resubmitted(manager):
+    manager.start_new_session("sepsis")
+    (prefetched_topic,), future = manager.executor.submitted[0]
+    future.set_result(_profile(prefetched_topic))
+
+    info = manager.start_new_session(manager.rotate_condition())
+
+    assert info["patient_id"] == f"P-{prefetched_topic}"
+    assert StubGenerator.generated == ["sepsis"]
+    assert len(manager.executor.submitted) == 2
+    assert manager.next_topic != prefetched_topic
+
+
+def test_failed_prefetch_is_resubmitted(manager):
+    manager.start_new_session("sepsis")
+    (prefetched_topic,), future = manager.executor.submitted[0]
+    future.set_exception(RuntimeError("rate limited"))
+
+    manager.start_new_session("migraine")
+
+    assert [args for args, _ in manager.executor.submitted] == [(prefetched_topic,), (prefetched_topic,)]
+
+
+def test_start_new_session_waits_on_matching_pending_prefetch(manager):
+    manager.start_new_session("sepsis")
+    (prefetched_topic,), future = manager.executor.submitted[0]
+    threading.Timer(0.05, future.set_result, [_profile(prefetched_topic)]).start()
+
+    info = manager.start_new_session(manager.rotate_condition())
+
+    assert info["patient_id"] == f"P-{prefetched_topic}"
+    assert StubGenerator.generated == ["sepsis"]